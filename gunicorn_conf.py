@@ -0,0 +1,19 @@
+"""Gunicorn configuration for production deployments.
+
+Run with: gunicorn -c gunicorn_conf.py server:app
+"""
+import multiprocessing
+
+bind = "0.0.0.0:5001"
+workers = (2 * multiprocessing.cpu_count()) + 1
+# gthread rather than gevent: pymongo is synchronous but releases the GIL
+# during network I/O, so threads overlap the Mongo waits without needing
+# monkey-patching. The background refresh/watcher threads run per worker,
+# started when each worker imports the app (preload_app stays off).
+worker_class = "gthread"
+threads = 4
+# No preload_app: each worker must import the app itself, so the MongoClient
+# is created after fork() (pymongo is not fork-safe) and the daemon
+# refresh/watcher threads — which would not survive a fork from the master —
+# start in every worker.
+preload_app = False
@@ -1,27 +1,52 @@
 import os
-from flask import Flask, jsonify, make_response
+from flask import Flask, Response, request
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne
 from pymongo.server_api import ServerApi
-import json
-import csv
+import functools
+import gzip
+import math
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import threading
 import time
-import hashlib
+
+import numpy as np
+import xxhash
+import orjson
+from cachetools import TTLCache, cached
 
 
 app = Flask(__name__)
 CORS(app) # allow all origins by default; in production, restrict to YOUR Vercel domain
 
 # Cache configuration
-CACHE = {}
 CACHE_TTL = 3600  # 1 hour in seconds
 CACHE_MAX_SIZE = 100  # Maximum number of cached items
+CACHE = TTLCache(maxsize=CACHE_MAX_SIZE, ttl=CACHE_TTL)
+CACHE_LOCK = threading.Lock()  # TTLCache is not thread-safe and Flask serves on threads
+
+# Bumped by the change-stream watcher whenever a source collection writes.
+# Cache keys embed this, so entries go stale the moment data actually changes
+# and live on past the TTL when it doesn't.
+DATA_VERSION = 0
 
 # 1) Configure your MongoDB URI (local or Atlas).
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI, server_api=ServerApi('1'))
-client.admin.command('ping')
+client = MongoClient(
+    MONGO_URI,
+    server_api=ServerApi('1'),
+    maxPoolSize=50,
+    minPoolSize=5,
+    maxIdleTimeMS=60000,
+    serverSelectionTimeoutMS=3000,
+    socketTimeoutMS=10000,
+    compressors="zstd,zlib",  # shrinks the matches document on the wire
+    retryReads=True,
+    connect=True,
+)
+client.admin.command('ping')  # fail fast and pre-warm the pool before the first request
 db = client.get_database(name="WPTable")
 WWP_db = client.get_database(name="WWP")
 
@@ -37,90 +62,450 @@ wwp_prob_col = WWP_db['Probabilities']
 wwp_delim_col = WWP_db["Delim"]
 wwp_matches_col = WWP_db["matches"] 
 
+# Index the key the aligned fetches and probability refresh look rows up by;
+# create_index is a no-op once the index exists.
+for _col in (win_col, prob_col, delim_col, wwp_win_col, wwp_prob_col, wwp_delim_col):
+    _col.create_index("Rank")
+
 print(f"Win documents: {win_col.count_documents({})}")
 print(f"Delim documents: {delim_col.count_documents({})}")
 print(f"Matches documents: {matches_col.count_documents({})}")
 
 # 3) We know exactly which ranks exist and in which order.
-RANK_ORDER = [str(i) for i in range(1, 21)] + ["unranked"] 
+RANK_ORDER = [str(i) for i in range(1, 21)] + ["unranked"]
 WWP_RANK_ORDER = [str(i) for i in range(1, 26)] + ["unranked"] #
 
-
-with open("mens_waterpolo_rankings.json", "r", encoding="utf-8") as f:
-    rankings = json.load(f)
-
-with open("womens_waterpolo_rankings.json", "r", encoding="utf-8") as f:
-    wwp_rankings = json.load(f)
+RANK_ORDER_SET = frozenset(RANK_ORDER)
+WWP_RANK_ORDER_SET = frozenset(WWP_RANK_ORDER)
+
+
+# Aligned matrix rows are small and change rarely, so memoize them per
+# collection. full_name includes the database, which disambiguates the
+# MWP/WWP collections that share names like "wins".
+ALIGNED_CACHE = TTLCache(maxsize=8, ttl=CACHE_TTL)
+ALIGNED_CACHE_LOCK = threading.Lock()  # shared by request, refresh, and watcher threads
+
+
+def fetch_collection_as_matrix_array(collection, rank_order, rank_set):
+    """Fetch a matrix collection as a dense (n, n) float array aligned to rank_order.
+
+    Only the Rank column and the rank_order columns are projected, so MongoDB
+    never ships fields we would throw away. Missing cells come back as NaN.
+    Holding the matrix in one contiguous array lets downstream code operate on
+    whole matrices at once instead of cell by cell.
+    """
+    projection = {"_id": 0, "Rank": 1, **{h: 1 for h in rank_order}}
+    index = {rank: i for i, rank in enumerate(rank_order)}
+    arr = np.full((len(rank_order), len(rank_order)), np.nan, dtype=np.float64)
+    for doc in collection.find({}, projection):
+        rank = doc.pop("Rank", None)
+        if rank is None:
+            continue
+        if rank not in rank_set:
+            rank = str(rank).strip().lower()
+        i = index.get(rank)
+        if i is None:
+            continue
+        for header, j in index.items():
+            val = doc.get(header)
+            if val not in (None, ""):
+                arr[i, j] = val
+    return arr
+
+
+@cached(cache=ALIGNED_CACHE, lock=ALIGNED_CACHE_LOCK,
+        key=lambda collection, rank_order, rank_set, is_float=False: (collection.full_name, is_float))
+def fetch_collection_as_matrix(collection, rank_order, rank_set, is_float=False):
+    """Fetch a matrix collection as plain row lists aligned to rank_order.
+
+    Thin JSON-shaped view over fetch_collection_as_matrix_array: NaN cells
+    become None and everything else is converted once at this edge. Rows are
+    positional — consumers index cells by position in the headers array, so
+    the payload carries no repeated per-row key strings.
+    """
+    arr = fetch_collection_as_matrix_array(collection, rank_order, rank_set)
+    conv = float if is_float else int  # pick the converter once, not per cell
+    return [
+        [None if math.isnan(val) else conv(val) for val in row]
+        for row in arr.tolist()
+    ]
+
+
+def refresh_probabilities(wins, delim, probs, rank_order, rank_set):
+    """Recompute the win-probability matrix from wins/Delim and store it.
+
+    The matrix endpoints only ever read the Probabilities collection; this is
+    the single place the division happens, so it runs on demand rather than
+    per request.
+    """
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_win = ex.submit(fetch_collection_as_matrix_array, wins, rank_order, rank_set)
+        f_games = ex.submit(fetch_collection_as_matrix_array, delim, rank_order, rank_set)
+        win_arr, games_arr = f_win.result(), f_games.result()
+    prob_arr = np.divide(win_arr, games_arr,
+                         out=np.full_like(win_arr, np.nan),
+                         where=games_arr > 0)
+
+    updates = []
+    for rank, row in zip(rank_order, prob_arr):
+        prob_doc = {"Rank": rank}
+        for header, val in zip(rank_order, row.tolist()):
+            prob_doc[header] = None if math.isnan(val) else val
+        updates.append(ReplaceOne({"Rank": rank}, prob_doc, upsert=True))
+
+    probs.bulk_write(updates)
+    # The cached copy of this collection is now stale.
+    with ALIGNED_CACHE_LOCK:
+        ALIGNED_CACHE.pop((probs.full_name, True), None)
+    return len(updates)
+
+
+RANKINGS_FILES = {
+    "MWP": "mens_waterpolo_rankings.json",
+    "WWP": "womens_waterpolo_rankings.json",
+}
+
+
+@functools.cache
+def get_rankings(league):
+    """Load the rankings JSON for a league on first use.
+
+    Deferring the load keeps startup fast and means endpoints that never touch
+    rankings (health checks, matrix) don't pay for the ~1 MB parse.
+    """
+    with open(RANKINGS_FILES[league], "rb") as f:
+        return orjson.loads(f.read())
+
+
+@functools.cache
+def get_rankings_sorted(league):
+    """Rankings as a date-sorted list of (datetime, ranking_list) pairs.
+
+    strptime is slow, so each date string is parsed exactly once here;
+    everything downstream works with real datetimes in chronological order.
+    """
+    parsed = [
+        (datetime.strptime(date_str.split('-')[0], "%m/%d/%Y"), ranking_list)
+        for date_str, ranking_list in get_rankings(league).items()
+    ]
+    parsed.sort(key=lambda entry: entry[0])
+    return parsed
+
+
+@functools.cache
+def get_team_history(league):
+    """Index ranking history per team, sorted by date.
+
+    Returns {team_name: (dates, rows)} where dates is a sorted list of
+    datetimes and rows holds the matching (iso_date, rank) pairs, so a
+    date-range query is two bisects and a slice instead of a scan over
+    every date and every team.
+    """
+    per_team = {}
+    for current_date, ranking_list in get_rankings_sorted(league):
+        for team in ranking_list:
+            per_team.setdefault(team['team_name'], []).append((current_date, team['ranking']))
+
+    index = {}
+    for name, entries in per_team.items():
+        dates = [dt for dt, _ in entries]
+        rows = [(dt.strftime("%Y-%m-%d"), rank) for dt, rank in entries]
+        index[name] = (dates, rows)
+    return index
+
+
+@functools.cache
+def get_team_name_index(league):
+    """Map lowercased team names to their canonical casing.
+
+    Precomputed once so case-insensitive lookups are a single dict hit rather
+    than a scan that lowercases every known team per request.
+    """
+    return {name.lower(): name for name in get_team_history(league)}
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_team_name(league, raw_name):
+    """Resolve a requested team name to its canonical casing, or None.
+
+    Exact hit first, then case-insensitive. Team names form a small finite
+    set, so memoizing per (league, raw string) makes repeated lookups free,
+    strip/lower included.
+    """
+    name = raw_name.strip()
+    if name in get_team_history(league):
+        return name
+    return get_team_name_index(league).get(name.lower())
+
+
+@functools.cache
+def get_teams_payload(league):
+    """Pre-serialized team list for a league.
+
+    Derived entirely from the static rankings JSON, so the body and ETag are
+    built once and the route just replays the bytes.
+    """
+    names = sorted(get_team_history(league))
+    body = orjson.dumps({"teams": names, "count": len(names)})
+    return body, xxhash.xxh3_128_hexdigest(body), gzip.compress(body, 9)
+
+
+def build_ranking_history(league, team_names, start_date, end_date):
+    """Build the ranking-history payload for a comma-separated list of teams"""
+    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+    end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+
+    team_list = [name.strip() for name in team_names.split(',')]
+    team_history = get_team_history(league)
+
+    resolved = set()
+    for raw in team_list:
+        name = normalize_team_name(league, raw)
+        if name is not None:
+            resolved.add(name)
+
+    history = []
+    for name in resolved:
+        record = team_history.get(name)
+        if record is None:
+            continue
+        dates, rows = record
+        lo = bisect_left(dates, start_dt)
+        hi = bisect_right(dates, end_dt)
+        for date_iso, rank in rows[lo:hi]:
+            history.append({
+                "team_name": name,
+                "date": date_iso,
+                "rank": rank
+            })
+
+    # Sort by date and team name
+    history.sort(key=lambda x: (x['date'], x['team_name']))
+
+    return {
+        "data": history,
+        "count": len(history),
+        "teams": team_list,
+        "date_range": {
+            "start": start_date,
+            "end": end_date
+        }
+    }
 
 
 # Cache management functions
 def cache_key_generator(*args):
-    """Generate a cache key from arguments"""
-    key_string = "_".join(str(arg) for arg in args)
-    return hashlib.md5(key_string.encode()).hexdigest()
+    """Build a cache key tuple, scoped to the current data version.
+
+    dict hashes tuples natively in C, so stringifying and hashing the
+    arguments first was pure overhead on every request.
+    """
+    return (DATA_VERSION, *args)
 
 def get_from_cache(key):
     """Get data from cache if it exists and is not expired"""
-    if key in CACHE:
-        data, timestamp = CACHE[key]
-        if time.time() - timestamp < CACHE_TTL:
-            return data
-        else:
-            # Remove expired entry
-            del CACHE[key]
-    return None
+    with CACHE_LOCK:
+        return CACHE.get(key)
 
 def set_cache(key, data):
-    """Set data in cache with timestamp"""
-    # Implement simple LRU by removing oldest entries if cache is full
-    if len(CACHE) >= CACHE_MAX_SIZE:
-        # Remove the oldest entry
-        oldest_key = min(CACHE.keys(), key=lambda k: CACHE[k][1])
-        del CACHE[oldest_key]
-    
-    CACHE[key] = (data, time.time())
-
-def add_cache_headers(response, max_age=3600):
-    """Add cache headers to response"""
+    """Set data in cache; TTLCache handles expiry and eviction"""
+    with CACHE_LOCK:
+        CACHE[key] = data
+
+def bytes_response(body, etag, max_age=3600, gzip_body=None):
+    """Build a cacheable JSON response from pre-serialized bytes.
+
+    A matching If-None-Match returns a bare 304 without shipping the body.
+    When a precompressed variant is supplied and the client accepts gzip, it
+    is served as-is — no per-request compression.
+    """
+    if request.if_none_match and etag in request.if_none_match:
+        response = Response(status=304)
+    elif gzip_body is not None and "gzip" in request.headers.get("Accept-Encoding", ""):
+        response = Response(gzip_body, mimetype="application/json")
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype="application/json")
     response.headers['Cache-Control'] = f'public, max-age={max_age}, s-maxage={max_age}, stale-while-revalidate=7200'
-    response.headers['ETag'] = hashlib.md5(response.get_data()).hexdigest()
+    response.headers['ETag'] = etag
+    if gzip_body is not None:
+        response.headers['Vary'] = 'Accept-Encoding'
     return response
 
+def plain_json(data, status=200):
+    """Uncached orjson response for small admin and error payloads"""
+    return Response(orjson.dumps(data), status=status, mimetype="application/json")
+
+def serialize_and_cache(cache_key, data, max_age=3600):
+    """Serialize data once, cache the bytes and ETag, and return the response.
+
+    Cache hits replay the stored bytes via bytes_response, so neither
+    serialization nor hashing runs again for the lifetime of the entry.
+    """
+    body = orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    etag = xxhash.xxh3_128_hexdigest(body)
+    set_cache(cache_key, (body, etag))
+    return bytes_response(body, etag, max_age)
+
+
+# The matrix responses are read-mostly reference data, so they are rendered to
+# bytes once and refreshed by a background thread; the request path just
+# writes the prebuilt body to the socket.
+MATRIX_SNAPSHOTS = {}  # league -> (body bytes, etag)
+
+MATRIX_SOURCES = {
+    "MWP": (delim_col, prob_col, RANK_ORDER, RANK_ORDER_SET),
+    "WWP": (wwp_delim_col, wwp_prob_col, WWP_RANK_ORDER, WWP_RANK_ORDER_SET),
+}
+
+
+def build_matrix_payload(league):
+    """Render a league's matrix response body and its ETag"""
+    delim, probs, rank_order, rank_set = MATRIX_SOURCES[league]
+    # pymongo releases the GIL during network I/O, so the two round trips to
+    # Atlas overlap instead of paying 2x RTT.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_prob = ex.submit(fetch_collection_as_matrix, probs, rank_order, rank_set, is_float=True)
+        f_delim = ex.submit(fetch_collection_as_matrix, delim, rank_order, rank_set)
+        prob_data, delim_data = f_prob.result(), f_delim.result()
+    result_data = {
+        "headers": rank_order,
+        "probMatrix": prob_data,
+        "delimMatrix": delim_data
+    }
+    body = orjson.dumps(result_data)
+    return body, xxhash.xxh3_128_hexdigest(body), gzip.compress(body, 9)
+
+
+def refresh_matrix_snapshots():
+    """Rebuild the pre-rendered matrix bodies for both leagues"""
+    for league in MATRIX_SOURCES:
+        MATRIX_SNAPSHOTS[league] = build_matrix_payload(league)
+
+
+def _matrix_refresh_loop():
+    while True:
+        time.sleep(CACHE_TTL)
+        try:
+            with ALIGNED_CACHE_LOCK:
+                ALIGNED_CACHE.clear()  # force fresh reads from MongoDB
+            refresh_matrix_snapshots()
+        except Exception as e:
+            print(f"Matrix snapshot refresh failed: {e}")
+
+
+def matrix_response(league):
+    """Serve the pre-rendered matrix body, building it on demand if missing"""
+    snapshot = MATRIX_SNAPSHOTS.get(league)
+    if snapshot is None:
+        snapshot = build_matrix_payload(league)
+        MATRIX_SNAPSHOTS[league] = snapshot
+    body, etag, gz = snapshot
+    return bytes_response(body, etag, max_age=CACHE_TTL, gzip_body=gz)
+
+
+try:
+    refresh_matrix_snapshots()
+except Exception as e:
+    print(f"Initial matrix snapshot build failed: {e}")
+
+threading.Thread(target=_matrix_refresh_loop, daemon=True).start()
+
+
+# The matches document per league is read-only at serving time and small
+# enough to keep resident, so pair lookups become a dict hit with no Mongo
+# round trip or BSON decode.
+MATCHES_DOCS = {}
+
+MATCHES_SOURCES = {
+    "MWP": matches_col,
+    "WWP": wwp_matches_col,
+}
+
+
+def refresh_matches_docs():
+    """Reload the per-league matches documents into memory"""
+    for league, col in MATCHES_SOURCES.items():
+        MATCHES_DOCS[league] = col.find_one({}, {"_id": 0}) or {}
+
+
+def get_matches_doc(league):
+    """Return the resident matches document, loading it on first use"""
+    doc = MATCHES_DOCS.get(league)
+    if doc is None:
+        doc = MATCHES_SOURCES[league].find_one({}, {"_id": 0}) or {}
+        MATCHES_DOCS[league] = doc
+    return doc
+
+
+try:
+    refresh_matches_docs()
+except Exception as e:
+    print(f"Initial matches load failed: {e}")
+
+
+WATCHED_COLLECTIONS = ["wins", "Delim", "Probabilities", "matches"]
+
+
+def _watch_data_changes():
+    global DATA_VERSION
+    try:
+        with client.watch([{"$match": {"ns.coll": {"$in": WATCHED_COLLECTIONS}}}]) as stream:
+            for _ in stream:
+                DATA_VERSION += 1
+                with ALIGNED_CACHE_LOCK:
+                    ALIGNED_CACHE.clear()
+                try:
+                    refresh_matrix_snapshots()
+                    refresh_matches_docs()
+                except Exception as e:
+                    print(f"Snapshot refresh failed after data change: {e}")
+    except Exception as e:
+        # Change streams need a replica set; without one we fall back to
+        # plain TTL expiry.
+        print(f"Change-stream watcher unavailable: {e}")
+
+
+threading.Thread(target=_watch_data_changes, daemon=True).start()
+
+
+def warm_cache():
+    """Pre-populate the matches cache for pairs among the top 5 ranks.
+
+    Works entirely off the resident matches documents, so warming costs no
+    extra round trips at all.
+    """
+    for prefix, league in (("matches", "MWP"), ("WWPmatches", "WWP")):
+        doc = get_matches_doc(league)
+        for i in range(1, 6):
+            for j in range(1, 6):
+                if i == j:
+                    continue
+                # Same orientation fallback as the matches endpoints
+                games = doc.get(f"{i-1}_{j-1}") or doc.get(f"{j-1}_{i-1}", [])
+                body = orjson.dumps({
+                    "matches": games,
+                    "count": len(games),
+                    "row_rank": str(i),
+                    "col_rank": str(j)
+                })
+                set_cache(cache_key_generator(prefix, str(i), str(j)),
+                          (body, xxhash.xxh3_128_hexdigest(body)))
+
+
+try:
+    warm_cache()
+except Exception as e:
+    print(f"Cache warm-up failed: {e}")
+
 
 @app.route("/api/MWP/matrix", methods=["GET"])
 def get_matrix():
     try:
-        # Check cache first
-        cache_key = cache_key_generator("matrix", "v1")
-        cached_data = get_from_cache(cache_key)
-        
-        if cached_data:
-            print("Serving matrix data from cache")
-            response = make_response(jsonify(cached_data))
-            return add_cache_headers(response), 200
-        
-        print("Fetching matrix data from database")
-        delim_data = list(delim_col.find({}, {"_id": 0}))# Game counts
-        prob_data = list(prob_col.find({}, {"_id": 0}))
-        
-        headers = RANK_ORDER.copy() # ["1","2",...,"20","unranked"]
-        
-        result_data = {
-            "headers": headers,
-            "probData": prob_data, # Changed from "winData" to "probData"
-            "delimData": delim_data
-        }
-        
-        # Cache the result
-        set_cache(cache_key, result_data)
-        
-        print(f"Returning {len(prob_data)} probability rows and {len(delim_data)} delim rows")
-        response = make_response(jsonify(result_data))
-        return add_cache_headers(response), 200
-        
+        return matrix_response("MWP")
     except Exception as e:
         print(f"Error in /api/matrix: {e}")
-        return jsonify({"error": str(e)}), 500
+        return plain_json({"error": str(e)}, status=500)
 
 @app.route("/api/MWP/matches/<row_rank>/<col_rank>", methods=["GET"])
 def get_matches(row_rank, col_rank):
@@ -132,18 +517,18 @@ def get_matches(row_rank, col_rank):
         
         if cached_data:
             print(f"Serving matches data for {row_rank}_{col_rank} from cache")
-            response = make_response(jsonify(cached_data))
-            return add_cache_headers(response), 200
+            return bytes_response(*cached_data)
         
         print(f"Fetching matches data for {row_rank}_{col_rank} from database")
         
         # Create the key for matches lookup
         # Try both directions since matches can be stored as "3_9" or "9_3"
         key1 = f"{int(row_rank)-1}_{int(col_rank)-1}"
+        key2 = f"{int(col_rank)-1}_{int(row_rank)-1}"
 
-        # Look for matches document
-        matches_doc = matches_col.find({},{"_id": 0})
-        games = list(matches_doc)[0][key1]
+        # Serve from the resident matches document; no Mongo round trip
+        matches_doc = get_matches_doc("MWP")
+        games = matches_doc.get(key1) or matches_doc.get(key2, [])
 
         result_data = {
             "matches": games,
@@ -152,15 +537,12 @@ def get_matches(row_rank, col_rank):
             "col_rank": col_rank
         }
         
-        # Cache the result
-        set_cache(cache_key, result_data)
-        
-        response = make_response(jsonify(result_data))
-        return add_cache_headers(response), 200
+        # Serialize once and cache the bytes alongside the ETag
+        return serialize_and_cache(cache_key, result_data)
         
     except Exception as e:
         print(f"Error in /api/matches/{row_rank}/{col_rank}: {e}")
-        return jsonify({"error": str(e)}), 500
+        return plain_json({"error": str(e)}, status=500)
     
 
 @app.route("/MWP/rankings/<team_names>/<start_date>/<end_date>", methods=["GET"])
@@ -172,94 +554,51 @@ def get_team_ranking_history(team_names, start_date, end_date):
         
         if cached_data:
             print(f"Serving ranking history for {team_names} from cache")
-            response = make_response(jsonify(cached_data))
-            return add_cache_headers(response), 200
+            return bytes_response(*cached_data)
         
         print(f"Fetching ranking history for {team_names} from database")
-        
-        # Convert string dates to datetime objects for comparison
-        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-        
-        # Parse team names (comma-separated)
-        team_list = [name.strip() for name in team_names.split(',')]
-        
-        history = []
-        for date_str, ranking_list in rankings.items():
-            # Parse date string to datetime object
-            current_date = datetime.strptime(date_str.split('-')[0], "%m/%d/%Y")
-            
-            # Check if current_date is within the specified range
-            if start_dt <= current_date <= end_dt:
-                for team in ranking_list:
-                    if team['team_name'] in team_list:
-                        history.append({
-                            "team_name": team['team_name'],
-                            "date": current_date.strftime("%Y-%m-%d"),
-                            "rank": team['ranking']
-                        })
-        
-        # Sort by date and team name
-        history.sort(key=lambda x: (x['date'], x['team_name']))
-        
-        result_data = {
-            "data": history,
-            "count": len(history),
-            "teams": team_list,
-            "date_range": {
-                "start": start_date,
-                "end": end_date
-            }
-        }
-        
-        # Cache the result
-        set_cache(cache_key, result_data)
-        
-        response = make_response(jsonify(result_data))
-        return add_cache_headers(response), 200
+
+        result_data = build_ranking_history("MWP", team_names, start_date, end_date)
+
+        # Serialize once and cache the bytes alongside the ETag
+        return serialize_and_cache(cache_key, result_data)
         
     except Exception as e:
         print(f"Error in /rankings/{team_names}/{start_date}/{end_date}: {e}")
-        return jsonify({"error": str(e)}), 500
+        return plain_json({"error": str(e)}, status=500)
     
 
 
+@app.route("/api/MWP/teams", methods=["GET"])
+def get_teams():
+    """List all team names that appear in the MWP rankings"""
+    try:
+        body, etag, gz = get_teams_payload("MWP")
+        return bytes_response(body, etag, gzip_body=gz)
+    except Exception as e:
+        print(f"Error in /api/MWP/teams: {e}")
+        return plain_json({"error": str(e)}, status=500)
+
+
 #WWP calls
 
+@app.route("/api/WWP/teams", methods=["GET"])
+def get_WWP_teams():
+    """List all team names that appear in the WWP rankings"""
+    try:
+        body, etag, gz = get_teams_payload("WWP")
+        return bytes_response(body, etag, gzip_body=gz)
+    except Exception as e:
+        print(f"Error in /api/WWP/teams: {e}")
+        return plain_json({"error": str(e)}, status=500)
+
 @app.route("/api/WWP/matrix", methods=["GET"])
 def get_WWP_matrix():
     try:
-        # Check cache first
-        cache_key = cache_key_generator("WWPmatrix", "v1")
-        cached_data = get_from_cache(cache_key)
-        
-        if cached_data:
-            print("Serving matrix data from cache")
-            response = make_response(jsonify(cached_data))
-            return add_cache_headers(response), 200
-        
-        print("Fetching matrix data from database")
-        delim_data = list(wwp_delim_col.find({}, {"_id": 0})) # Game counts
-        prob_data = list(wwp_prob_col.find({}, {"_id": 0}))
-        
-        headers = WWP_RANK_ORDER.copy() # ["1","2",...,"20","unranked"]
-        
-        result_data = {
-            "headers": headers,
-            "probData": prob_data, # Changed from "winData" to "probData"
-            "delimData": delim_data
-        }
-        
-        # Cache the result
-        set_cache(cache_key, result_data)
-        
-        print(f"Returning {len(prob_data)} probability rows and {len(delim_data)} delim rows")
-        response = make_response(jsonify(result_data))
-        return add_cache_headers(response), 200
-        
+        return matrix_response("WWP")
     except Exception as e:
         print(f"Error in /api/matrix: {e}")
-        return jsonify({"error": str(e)}), 500
+        return plain_json({"error": str(e)}, status=500)
 
 @app.route("/api/WWP/matches/<row_rank>/<col_rank>", methods=["GET"])
 def get_WWP_matches(row_rank, col_rank):
@@ -271,18 +610,18 @@ def get_WWP_matches(row_rank, col_rank):
         
         if cached_data:
             print(f"Serving matches data for {row_rank}_{col_rank} from cache")
-            response = make_response(jsonify(cached_data))
-            return add_cache_headers(response), 200
+            return bytes_response(*cached_data)
         
         print(f"Fetching matches data for {row_rank}_{col_rank} from database")
         
         # Create the key for matches lookup
         # Try both directions since matches can be stored as "3_9" or "9_3"
         key1 = f"{int(row_rank)-1}_{int(col_rank)-1}"
+        key2 = f"{int(col_rank)-1}_{int(row_rank)-1}"
 
-        # Look for matches document
-        matches_doc = wwp_matches_col.find({},{"_id": 0})
-        games = list(matches_doc)[0][key1]
+        # Serve from the resident matches document; no Mongo round trip
+        matches_doc = get_matches_doc("WWP")
+        games = matches_doc.get(key1) or matches_doc.get(key2, [])
 
         result_data = {
             "matches": games,
@@ -291,15 +630,12 @@ def get_WWP_matches(row_rank, col_rank):
             "col_rank": col_rank
         }
         
-        # Cache the result
-        set_cache(cache_key, result_data)
-        
-        response = make_response(jsonify(result_data))
-        return add_cache_headers(response), 200
+        # Serialize once and cache the bytes alongside the ETag
+        return serialize_and_cache(cache_key, result_data)
         
     except Exception as e:
         print(f"Error in /api/matches/{row_rank}/{col_rank}: {e}")
-        return jsonify({"error": str(e)}), 500
+        return plain_json({"error": str(e)}, status=500)
     
 
 @app.route("/WWP/rankings/<team_names>/<start_date>/<end_date>", methods=["GET"])
@@ -311,92 +647,94 @@ def get_WWP_team_ranking_history(team_names, start_date, end_date):
         
         if cached_data:
             print(f"Serving ranking history for {team_names} from cache")
-            response = make_response(jsonify(cached_data))
-            return add_cache_headers(response), 200
+            return bytes_response(*cached_data)
         
         print(f"Fetching ranking history for {team_names} from database")
-        
-        # Convert string dates to datetime objects for comparison
-        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-        
-        # Parse team names (comma-separated)
-        team_list = [name.strip() for name in team_names.split(',')]
-        
-        history = []
-        for date_str, ranking_list in wwp_rankings.items():
-            # Parse date string to datetime object
-            current_date = datetime.strptime(date_str.split('-')[0], "%m/%d/%Y")
-            
-            # Check if current_date is within the specified range
-            if start_dt <= current_date <= end_dt:
-                for team in ranking_list:
-                    if team['team_name'] in team_list:
-                        history.append({
-                            "team_name": team['team_name'],
-                            "date": current_date.strftime("%Y-%m-%d"),
-                            "rank": team['ranking']
-                        })
-        
-        # Sort by date and team name
-        history.sort(key=lambda x: (x['date'], x['team_name']))
-        
-        result_data = {
-            "data": history,
-            "count": len(history),
-            "teams": team_list,
-            "date_range": {
-                "start": start_date,
-                "end": end_date
-            }
-        }
-        
-        # Cache the result
-        set_cache(cache_key, result_data)
-        
-        response = make_response(jsonify(result_data))
-        return add_cache_headers(response), 200
+
+        result_data = build_ranking_history("WWP", team_names, start_date, end_date)
+
+        # Serialize once and cache the bytes alongside the ETag
+        return serialize_and_cache(cache_key, result_data)
         
     except Exception as e:
         print(f"Error in /rankings/{team_names}/{start_date}/{end_date}: {e}")
-        return jsonify({"error": str(e)}), 500
+        return plain_json({"error": str(e)}, status=500)
+
+
+@app.route("/api/MWP/probabilities/refresh", methods=["POST"])
+def refresh_MWP_probabilities():
+    """Recompute the MWP probability matrix from the wins/Delim collections"""
+    try:
+        count = refresh_probabilities(win_col, delim_col, prob_col, RANK_ORDER, RANK_ORDER_SET)
+        MATRIX_SNAPSHOTS["MWP"] = build_matrix_payload("MWP")
+        return plain_json({"message": f"Recomputed probabilities for {count} ranks"})
+    except Exception as e:
+        print(f"Error in /api/MWP/probabilities/refresh: {e}")
+        return plain_json({"error": str(e)}, status=500)
+
+@app.route("/api/WWP/probabilities/refresh", methods=["POST"])
+def refresh_WWP_probabilities():
+    """Recompute the WWP probability matrix from the wins/Delim collections"""
+    try:
+        count = refresh_probabilities(wwp_win_col, wwp_delim_col, wwp_prob_col, WWP_RANK_ORDER, WWP_RANK_ORDER_SET)
+        MATRIX_SNAPSHOTS["WWP"] = build_matrix_payload("WWP")
+        return plain_json({"message": f"Recomputed probabilities for {count} ranks"})
+    except Exception as e:
+        print(f"Error in /api/WWP/probabilities/refresh: {e}")
+        return plain_json({"error": str(e)}, status=500)
+
+
+@app.route("/api/matches/refresh", methods=["POST"])
+def refresh_matches():
+    """Reload the resident matches documents from MongoDB"""
+    try:
+        refresh_matches_docs()
+        return plain_json({"message": "Matches reloaded", "leagues": list(MATCHES_DOCS.keys())})
+    except Exception as e:
+        print(f"Error in /api/matches/refresh: {e}")
+        return plain_json({"error": str(e)}, status=500)
 
 
- 
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Simple health check endpoint"""
-    return jsonify({"status": "healthy", "message": "Flask server is running"}), 200
+    return plain_json({"status": "healthy", "message": "Flask server is running"})
 
 @app.route("/api/cache/info", methods=["GET"])
 def cache_info():
     """Get cache statistics"""
-    cache_stats = {
-        "cache_size": len(CACHE),
-        "max_cache_size": CACHE_MAX_SIZE,
-        "cache_ttl_seconds": CACHE_TTL,
-        "cached_keys": list(CACHE.keys()) if len(CACHE) < 20 else f"{len(CACHE)} keys (too many to list)"
-    }
-    return jsonify(cache_stats), 200
+    with CACHE_LOCK:
+        cache_stats = {
+            "cache_size": len(CACHE),
+            "max_cache_size": CACHE_MAX_SIZE,
+            "cache_ttl_seconds": CACHE_TTL,
+            "cached_keys": list(CACHE.keys()) if len(CACHE) < 20 else f"{len(CACHE)} keys (too many to list)"
+        }
+    return plain_json(cache_stats)
 
 @app.route("/api/cache/clear", methods=["POST"])
 def clear_cache():
     """Clear all cache entries"""
-    global CACHE
-    old_size = len(CACHE)
-    CACHE.clear()
-    return jsonify({
+    with CACHE_LOCK:
+        old_size = len(CACHE)
+        CACHE.clear()
+    with ALIGNED_CACHE_LOCK:
+        old_size += len(ALIGNED_CACHE)
+        ALIGNED_CACHE.clear()
+    return plain_json({
         "message": f"Cache cleared successfully. Removed {old_size} entries.",
         "cache_size": len(CACHE)
-    }), 200
+    })
 
 
 
 
 if __name__ == "__main__":
-    
-    # When you run locally: python app.py → listens on http://127.0.0.1:5001
-    app.run(host="0.0.0.0", port=5001, debug=True)
+
+    # Local development only: python server.py → listens on http://127.0.0.1:5001
+    # Production runs under gunicorn: gunicorn -c gunicorn_conf.py server:app
+    if os.environ.get("FLASK_ENV", "dev") == "dev":
+        app.run(host="0.0.0.0", port=5001, debug=True)
 
     
     